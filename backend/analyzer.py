@@ -1,77 +1,337 @@
 import json
 import os
 import pathlib
+import time
+from array import array
 from collections import Counter
-from datetime import datetime
+from functools import lru_cache
 
 try:
-    from rich.console import Console
-    from rich.panel import Panel
-    from rich.syntax import Syntax
-    from rich.table import Table
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+try:
+    import numpy as np
 except ImportError:
-    print("Error: The 'rich' library is required. Please run 'pip install rich'.")
-    exit(1)
+    np = None
+
+# The logger owns the rotation scheme (events.jsonl.1, .2, ...)
+from copilot_logger import rotated_event_files
 
 # --- Configuration ---
 # This should match the BASE_DIR in your copilot_logger.py
 BASE_DIR = pathlib.Path(os.path.expanduser("~/.mitmproxy/intercepter_vscode/copilot_mitm"))
 EVENTS_PATH = BASE_DIR / "events.jsonl"
+HIST_PATH = BASE_DIR / "hist.json"
+READ_CHUNK_SIZE = 1 << 20  # Read events.jsonl in 1 MiB blocks
+LIST_LIMIT = 200  # Only the most recent requests are rendered in the list view
+
+_console_instance = None
+
+
+def _console():
+    """Returns the shared Rich console, importing rich and creating it on first use."""
+    global _console_instance
+    if _console_instance is None:
+        try:
+            from rich.console import Console
+        except ImportError:
+            print("Error: The 'rich' library is required. Please run 'pip install rich'.")
+            exit(1)
+        _console_instance = Console()
+    return _console_instance
+
+
+def _ts_end_key(event: dict) -> float:
+    return event.get("ts_end") or 0
+
 
-console = Console()
+def iter_jsonl(path: pathlib.Path):
+    """Yields parsed records from a JSONL file, reading it in large binary blocks."""
+    with open(path, "rb") as f:
+        tail = b""
+        while True:
+            block = f.read(READ_CHUNK_SIZE)
+            if not block:
+                break
+            lines = (tail + block).split(b"\n")
+            # The last part might be incomplete, so it is carried over to the next block
+            tail = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield _loads(line)
+        # An unterminated last line is still being written (or was cut off); skip it like EventCache does
+
+
+class EventCache:
+    """
+    Keeps the parsed events of an append-only JSONL file in memory.
+    On reload only the lines appended since the previous call are parsed.
+    The most recently rotated copy (`<name>.1`) is loaded alongside the live file,
+    so the list does not come up empty right after a rotation.
+
+    Records are kept in file order next to a packed `ts_end` column; the
+    most-recent-first `events` view is an argsort over that column.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.records: list[dict] = []
+        self.ts_end = array("d")
+        self.events: list[dict] = []
+        self.last_offset = 0
+        self.last_inode = None
+
+    def _append(self, records: list[dict]):
+        self.records.extend(records)
+        self.ts_end.extend(_ts_end_key(r) for r in records)
+        # Sort by timestamp descending (most recent first)
+        if np is not None:
+            # Negate rather than reverse, so equal timestamps keep file order like sorted(reverse=True)
+            order = np.argsort(-np.frombuffer(self.ts_end, dtype=np.float64), kind="stable").tolist()
+        else:
+            order = sorted(range(len(self.ts_end)), key=self.ts_end.__getitem__, reverse=True)
+        all_records = self.records
+        self.events = [all_records[i] for i in order]
+
+    def load(self) -> list[dict]:
+        st = self.path.stat()
+        # The file was replaced or truncated: start over from byte 0
+        if st.st_ino != self.last_inode or st.st_size < self.last_offset:
+            self.records = []
+            self.ts_end = array("d")
+            self.events = []
+            self.last_offset = 0
+            self.last_inode = st.st_ino
+            previous = self.path.with_name(f"{self.path.name}.1")
+            if previous.exists():
+                self._append(list(iter_jsonl(previous)))
+        if st.st_size == self.last_offset:
+            return self.events
+
+        with open(self.path, "rb") as f:
+            f.seek(self.last_offset)
+            data = f.read()
+        # Leave a trailing, partially written line for the next call
+        end = data.rfind(b"\n") + 1
+        self.last_offset += end
+        new_records = [_loads(line) for line in data[:end].split(b"\n") if line.strip()]
+        if new_records:
+            self._append(new_records)
+        return self.events
+
+
+_event_cache = EventCache(EVENTS_PATH)
 
 
 def load_events():
-    """Loads all events from the events.jsonl file."""
+    """Loads all events from the events.jsonl file, parsing only lines added since the last call."""
     if not EVENTS_PATH.exists():
-        console.print(f"[bold red]Error:[/bold red] Events file not found at {EVENTS_PATH}")
+        _console().print(f"[bold red]Error:[/bold red] Events file not found at {EVENTS_PATH}")
         return []
-    with open(EVENTS_PATH, "r", encoding="utf-8") as f:
-        events = [json.loads(line) for line in f]
-    # Sort by timestamp descending (most recent first)
-    return sorted(events, key=lambda x: x.get("ts_end", 0), reverse=True)
+    return _event_cache.load()
+
+
+def _summarize_file(path: pathlib.Path) -> dict:
+    """Aggregates one events file in a single streaming pass."""
+    hosts = {}
+    methods = {}
+    status_codes = array("H")
+    latencies = array("d")
+    # One pass over the file updates every aggregate
+    for e in iter_jsonl(path):
+        host = e["host"]
+        method = e["method"]
+        hosts[host] = hosts.get(host, 0) + 1
+        methods[method] = methods.get(method, 0) + 1
+        status_codes.append(e["status"])
+        lt = e.get("latency_total_s")
+        if lt is not None:
+            latencies.append(lt)
+
+    # Reduce the packed columns in C when NumPy is available
+    if np is not None:
+        counts = np.bincount(np.frombuffer(status_codes, dtype=np.uint16), minlength=600)
+        statuses = {int(code): int(counts[code]) for code in np.flatnonzero(counts)}
+        lat = np.frombuffer(latencies, dtype=np.float64)
+        lat_mean = float(lat.mean()) if lat.size else None
+        lat_max = float(lat.max()) if lat.size else None
+    else:
+        statuses = Counter(status_codes)
+        lat_mean = sum(latencies) / len(latencies) if latencies else None
+        lat_max = max(latencies) if latencies else None
+
+    return {
+        "total_reqs": len(status_codes),
+        "hosts": hosts,
+        "statuses": statuses,
+        "methods": methods,
+        "lat_mean": lat_mean,
+        "lat_max": lat_max,
+        "lat_n": len(latencies),
+    }
+
+
+def _merge_summaries(summaries: list[dict]) -> dict:
+    """Combines per-file summaries into one."""
+    if len(summaries) == 1:
+        return summaries[0]
+    merged = {"total_reqs": 0, "hosts": {}, "statuses": {}, "methods": {}, "lat_mean": None, "lat_max": None, "lat_n": 0}
+    lat_total = 0.0
+    for summary in summaries:
+        merged["total_reqs"] += summary["total_reqs"]
+        for field in ("hosts", "statuses", "methods"):
+            counts = merged[field]
+            for key, count in summary[field].items():
+                counts[key] = counts.get(key, 0) + count
+        if summary["lat_n"]:
+            lat_total += summary["lat_mean"] * summary["lat_n"]
+            merged["lat_n"] += summary["lat_n"]
+            if merged["lat_max"] is None or summary["lat_max"] > merged["lat_max"]:
+                merged["lat_max"] = summary["lat_max"]
+    if merged["lat_n"]:
+        merged["lat_mean"] = lat_total / merged["lat_n"]
+    return merged
+
+
+# Per-file summaries keyed by (device, inode, mtime, size); rotated files are
+# immutable, so they keep hitting the cache even after being renamed
+_summary_cache: dict[tuple, dict] = {}
+
+
+def summarize_stream(path: pathlib.Path = EVENTS_PATH) -> dict | None:
+    """
+    Aggregates an events file and its rotated copies, streaming each file without materializing the events.
+    Each file's aggregate is cached until its mtime or size changes.
+    """
+    files = [p for p in (*rotated_event_files(path), path) if p.exists()]
+    if not files:
+        _console().print(f"[bold red]Error:[/bold red] Events file not found at {path}")
+        return None
+
+    summaries = []
+    keys = set()
+    for file in files:
+        st = file.stat()
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        keys.add(key)
+        if key not in _summary_cache:
+            _summary_cache[key] = _summarize_file(file)
+        summaries.append(_summary_cache[key])
+    # Drop aggregates of files that changed or were rotated away
+    for stale in _summary_cache.keys() - keys:
+        del _summary_cache[stale]
+    return _merge_summaries(summaries)
+
+
+def _hist_quantile(buckets: list[int], count: int, q: float, scale: int, offset: int) -> float:
+    """Returns the upper bound (in seconds) of the histogram bucket holding the q-quantile."""
+    target = q * count
+    seen = 0
+    for i, n in enumerate(buckets):
+        seen += n
+        if seen >= target:
+            break
+    return 2 ** ((i + 1 - offset) / scale)
+
+
+def load_latency_histogram(path: pathlib.Path = HIST_PATH) -> dict | None:
+    """
+    Reads the per-host latency histograms maintained by copilot_logger.py and merges them.
+    Returns count, mean, max and approximate p50/p95 without touching events.jsonl.
+    """
+    if not path.exists():
+        return None
+    data = _loads(path.read_bytes())
+    buckets = [0] * data["buckets"]
+    count = 0
+    total = 0.0
+    lat_max = 0.0
+    for entry in data["hosts"].values():
+        count += entry["count"]
+        total += entry["sum"]
+        lat_max = max(lat_max, entry["max"])
+        for i, n in enumerate(entry["buckets"]):
+            buckets[i] += n
+    if not count:
+        return None
+    scale, offset = data["scale"], data["offset"]
+    return {
+        "count": count,
+        "mean": total / count,
+        "max": lat_max,
+        "p50": _hist_quantile(buckets, count, 0.50, scale, offset),
+        "p95": _hist_quantile(buckets, count, 0.95, scale, offset),
+    }
+
+
+@lru_cache(maxsize=4096)
+def _fmt_ts(sec: int) -> str:
+    """Formats a whole-second timestamp; events within the same second share the cached string."""
+    return time.strftime("%H:%M:%S", time.localtime(sec))
+
+
+@lru_cache(maxsize=64)
+def _read_body_cached(path_str: str, mtime_ns: int) -> str:
+    return pathlib.Path(path_str).read_text(encoding="utf-8")
 
 
 def read_body_content(path_str: str | None) -> str:
-    """Reads the content of a request/response body file."""
+    """Reads the content of a request/response body file, reusing it until the file changes."""
     if not path_str:
         return "[No body file path recorded]"
     path = pathlib.Path(path_str)
     if not path.exists():
         return f"[File not found: {path.name}]"
-    return path.read_text(encoding="utf-8")
+    return _read_body_cached(path_str, path.stat().st_mtime_ns)
 
 
-def display_summary(events):
-    """Calculates and displays a summary of all requests."""
-    if not events:
+def display_summary(summary, hist=None):
+    """
+    Displays a summary of all requests, as aggregated by summarize_stream.
+    Latency percentiles come from the logger's all-time histogram (see load_latency_histogram), if present;
+    unlike the other rows they are not limited to the current and rotated event files.
+    """
+    from rich.table import Table
+
+    console = _console()
+    if not summary or not summary["total_reqs"]:
         console.print("[yellow]No events to summarize.[/yellow]")
         return
 
-    total_reqs = len(events)
-    hosts = Counter(e["host"] for e in events)
-    statuses = Counter(e["status"] for e in events)
-    methods = Counter(e["method"] for e in events)
-    latencies = [e["latency_total_s"] for e in events if e.get("latency_total_s") is not None]
+    hosts = summary["hosts"]
+    statuses = summary["statuses"]
+    methods = summary["methods"]
 
     table = Table(title="[bold cyan]Traffic Summary[/bold cyan]")
     table.add_column("Metric", style="magenta")
     table.add_column("Value", style="green")
 
-    table.add_row("Total Requests", str(total_reqs))
+    table.add_row("Total Requests", str(summary["total_reqs"]))
     table.add_row("Hosts", "\n".join([f"{h}: {c}" for h, c in hosts.items()]))
     table.add_row("Status Codes", "\n".join([f"{s}: {c}" for s, c in statuses.items()]))
     table.add_row("HTTP Methods", "\n".join([f"{m}: {c}" for m, c in methods.items()]))
-    if latencies:
-        table.add_row("Avg. Latency", f"{sum(latencies) / len(latencies):.2f}s")
-        table.add_row("Max Latency", f"{max(latencies):.2f}s")
+    if summary["lat_n"]:
+        table.add_row("Avg. Latency", f"{summary['lat_mean']:.2f}s")
+        table.add_row("Max Latency", f"{summary['lat_max']:.2f}s")
+    if hist:
+        # hist.json spans every request ever logged, not just the event files summarized above
+        table.add_row("p50 Latency (all-time)", f"≤ {hist['p50']:.2f}s  (approx., {hist['count']} reqs)")
+        table.add_row("p95 Latency (all-time)", f"≤ {hist['p95']:.2f}s  (approx., {hist['count']} reqs)")
 
     console.print(table)
 
 
 def list_requests(events):
-    """Displays a list of all captured requests."""
-    table = Table(title="[bold cyan]Captured Requests[/bold cyan]", show_lines=True)
+    """Displays a list of the most recent captured requests."""
+    from rich.table import Table
+
+    shown = events[:LIST_LIMIT]
+    caption = f"Showing the {len(shown)} most recent of {len(events)} requests" if len(events) > len(shown) else None
+    table = Table(title="[bold cyan]Captured Requests[/bold cyan]", caption=caption, show_lines=True)
     table.add_column("#", style="dim", justify="right")
     table.add_column("Time", style="magenta")
     table.add_column("Method", style="bold yellow")
@@ -79,22 +339,33 @@ def list_requests(events):
     table.add_column("Status", style="blue")
     table.add_column("Latency", style="cyan")
 
-    for i, event in enumerate(events):
-        status_color = "green" if 200 <= event["status"] < 300 else "red"
-        dt = datetime.fromtimestamp(event["ts_end"]).strftime("%H:%M:%S")
-        table.add_row(
-            str(i),
-            dt,
-            event["method"],
-            f"{event['host']}{event['path']}",
-            f"[{status_color}]{event['status']}[/{status_color}]",
-            f"{event['latency_total_s']:.3f}s" if event.get("latency_total_s") else "N/A",
+    # Build all rows up front, then hand them to Rich in one go
+    rows = []
+    for i, event in enumerate(shown):
+        status = event["status"]
+        latency = event.get("latency_total_s")
+        rows.append(
+            (
+                str(i),
+                _fmt_ts(int(event["ts_end"])),
+                event["method"],
+                f"{event['host']}{event['path']}",
+                f"[green]{status}[/green]" if 200 <= status < 300 else f"[red]{status}[/red]",
+                f"{latency:.3f}s" if latency else "N/A",
+            )
         )
-    console.print(table)
+    for row in rows:
+        table.add_row(*row)
+    _console().print(table)
 
 
 def view_request_details(events):
     """Prompts the user to select a request and shows its details."""
+    from rich.panel import Panel
+    from rich.syntax import Syntax
+    from rich.table import Table
+
+    console = _console()
     if not events:
         console.print("[yellow]No requests to view.[/yellow]")
         return
@@ -133,8 +404,8 @@ def view_request_details(events):
 
 def main():
     """Main interactive loop."""
+    console = _console()
     while True:
-        events = load_events()
         console.print("\n[bold]GitHub Copilot Log Analyzer[/bold]")
         console.print("─" * 30)
         console.print("[1] Show Summary")
@@ -144,10 +415,11 @@ def main():
         choice = console.input("[bold]Choose an option: [/bold]")
 
         if choice == "1":
-            display_summary(events)
+            display_summary(summarize_stream(), load_latency_histogram())
         elif choice == "2":
-            list_requests(events)
+            list_requests(load_events())
         elif choice == "3":
+            events = load_events()
             list_requests(events)
             if events:
                 view_request_details(events)
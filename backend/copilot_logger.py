@@ -1,40 +1,86 @@
 # copilot_logger.py
-import os, json, time, pathlib
-from typing import Optional, Callable
+import os, json, math, time, pathlib, threading
+from collections import defaultdict
+from typing import Final, Optional, Callable
 from mitmproxy import http, ctx
 
-ALLOWED_HOSTS = {
+# Per-flow parsing and summarizing helpers; compiled with mypyc when built (see run.txt)
+from copilot_logger_hot import (
+    _estimate_tokens,
+    _reconstruct_sse_response,
+    _summarize_req_json,
+    _summarize_resp_json,
+    _append_sse_data,
+)
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+ALLOWED_HOSTS = frozenset({
     "api.githubcopilot.com",
     "api.individual.githubcopilot.com",
     "proxy.githubcopilot.com",
     "proxy.individual.githubcopilot.com",
-}
+})
 
 # --- Configuration ---
 # Set these to True to save the full request/response bodies and headers.
 # WARNING: This can create very large log files.
-SAVE_BODIES = False
-SAVE_HEADERS = False
+SAVE_BODIES: Final = False
+SAVE_HEADERS: Final = False
 # --- End Configuration ---
 
 BASE_DIR = pathlib.Path(os.path.expanduser("~/.mitmproxy/intercepter_vscode/copilot_mitm"))
 EVENTS_PATH = BASE_DIR / "events.jsonl"
+EVENTS_BUFFER_SIZE = 1 << 16
+# Rotate events.jsonl to events.jsonl.1 (.2, ...) once it grows past this size
+EVENTS_MAX_BYTES = 50 * 1024 * 1024
+EVENTS_KEEP_ROTATED = 5
+# Per-host latency histograms, maintained incrementally so summaries never rescan events.jsonl.
+# Bucket i holds latencies below 2 ** ((i + 1 - HIST_OFFSET) / HIST_SCALE) seconds.
+HIST_PATH = BASE_DIR / "hist.json"
+HIST_BUCKETS = 48
+HIST_SCALE = 2
+HIST_OFFSET = 20
+HIST_WRITE_EVERY = 20  # events between hist.json rewrites
+HIST_WRITE_DELAY_S = 5.0  # longest a recorded latency waits before hist.json is rewritten
 BASE_DIR.mkdir(parents=True, exist_ok=True)
 
 # -------- helpers
 
-def _is_copilot_host(host: str) -> bool:
-    return host in ALLOWED_HOSTS
-
-def _looks_like_sse(ct: str) -> bool:
-    return "text/event-stream" in (ct or "").lower()
-
 def _decode(b: Optional[bytes]) -> str:
     if not b:
         return ""
     # Never raise—replace errors so we keep as much text as possible
     return b.decode("utf-8", errors="replace")
 
+def _header_pairs(headers: http.Headers) -> list:
+    # (name, value) pairs straight from the raw fields; keeps repeated headers and skips the dict build
+    return [(_decode(k), _decode(v)) for k, v in headers.fields]
+
+def _body_len(message: http.Message, has_body: bool = True) -> int:
+    # Content-Length when the peer sent a usable one; otherwise count the raw body.
+    # Without a body (HEAD, 1xx/204/304) the header describes content that is never sent.
+    if has_body:
+        length = message.headers.get("content-length", "").strip()
+        if length.isdigit():
+            return int(length)
+    return len(message.raw_content or b"")
+
+def _response_has_body(flow: http.HTTPFlow) -> bool:
+    status = flow.response.status_code
+    return flow.request.method != "HEAD" and status >= 200 and status not in (204, 304)
+
 def _safe_float(x: Optional[float]) -> Optional[float]:
     try:
         return float(x) if x is not None else None
@@ -45,258 +91,167 @@ def _safe_json(b: Optional[bytes]) -> Optional[dict]:
     if not b:
         return None
     try:
-        return json.loads(b)
-    except json.JSONDecodeError:
+        return _loads(b)
+    except json.JSONDecodeError:  # orjson.JSONDecodeError subclasses it
         return {"error": "invalid json", "content": _decode(b)[:1000]}
 
-def _summarize_req_json(data: Optional[dict]) -> Optional[dict]:
-    """Removes large message content from request JSON to save space."""
-    if not data or not isinstance(data, dict):
-        return data
-    
-    summary = data.copy()
-
-    # Handle chat-like requests with "messages"
-    if "messages" in summary and isinstance(summary["messages"], list):
-        new_messages = []
-        for msg in summary["messages"]:
-            if isinstance(msg, dict) and "content" in msg and isinstance(msg.get("content"), str):
-                new_msg = msg.copy()
-                new_msg["content"] = new_msg["content"][:100] + "..."
-                new_messages.append(new_msg)
-            else:
-                new_messages.append(msg)
-        summary["messages"] = new_messages
-
-    # Handle completion-like requests with "prompt"
-    if "prompt" in summary and isinstance(summary.get("prompt"), str):
-        summary["prompt"] = summary["prompt"][:100] + "..."
-
-    # Handle completion-like requests with "suffix"
-    if "suffix" in summary and isinstance(summary.get("suffix"), str):
-        summary["suffix"] = summary["suffix"][:100] + "..."
-
-        # Handle "prediction" data which can contain large context
-    if "prediction" in summary and isinstance(summary.get("prediction"), dict):
-        new_prediction = summary["prediction"].copy()
-        if "content" in new_prediction and isinstance(new_prediction.get("content"), str):
-            new_prediction["content"] = new_prediction["content"][:100] + "..."
-        summary["prediction"] = new_prediction
-
-    # Handle "extra" data which can contain large context
-    if "extra" in summary and isinstance(summary.get("extra"), dict):
-        new_extra = summary["extra"].copy()
-        if "context" in new_extra and isinstance(new_extra.get("context"), list):
-            new_context = []
-            for item in new_extra["context"]:
-                if isinstance(item, str) and len(item) > 100:
-                    new_context.append(item[:100] + "...")
-                else:
-                    new_context.append(item)
-            new_extra["context"] = new_context
-        summary["extra"] = new_extra
-        
-    return summary
-
-def _summarize_resp_json(data: Optional[dict]) -> Optional[dict]:
-    """Removes large message content from response JSON to save space."""
-    if not data or not isinstance(data, dict):
-        return data
-
-    summary = data.copy()
-    if "choices" in summary and isinstance(summary["choices"], list):
-        new_choices = []
-        for choice in summary["choices"]:
-            if isinstance(choice, dict):
-                new_choice = choice.copy()
-                # Handle chat-like responses
-                if "message" in new_choice and isinstance(new_choice["message"], dict):
-                    new_message = new_choice["message"].copy()
-                    if "content" in new_message and isinstance(new_message.get("content"), str):
-                        new_message["content"] = new_message["content"][:100] + "..."
-                    new_choice["message"] = new_message
-                
-                # Handle completion-like responses
-                if "text" in new_choice and isinstance(new_choice.get("text"), str):
-                    new_choice["text"] = new_choice["text"][:100] + "..."
-
-                new_choices.append(new_choice)
-            else:
-                new_choices.append(choice)
-        summary["choices"] = new_choices
-
-    return summary
-
-def _reconstruct_sse_response(chunks: list[str]) -> dict:
-    """
-    Reconstructs a single JSON response from a list of SSE data chunks.
-    Handles both 'chat.completion' (delta.content) and 'completion' (text) formats.
-    """
-    full_content = ""
-    role = None
-    finish_reason = None
-    final_usage = {}
-    metadata = {}
-    model_type = None # 'chat' or 'completion'
-
-    for chunk_str in chunks:
-        if not chunk_str.strip():
-            continue
-        try:
-            data = json.loads(chunk_str)
-            if not isinstance(data, dict):
-                ctx.log.warn(f"SSE: Parsed data is not a dictionary: {chunk_str[:100]}")
-                continue
-
-            # Update metadata with any new non-null info from the current chunk
-            # This ensures we capture final metadata like 'id', 'model', 'usage'
-            for k, v in data.items():
-                if k != "choices":
-                    metadata[k] = v
-            
-            # Merge usage stats, as they can appear in multiple chunks
-            if "usage" in data and isinstance(data["usage"], dict):
-                final_usage.update(data["usage"])
-
-            choices = data.get("choices")
-            if not choices or not isinstance(choices, list) or not choices[0]:
-                continue # This chunk is likely metadata-only (e.g., final usage stats)
-
-            choice = choices[0]
-
-            # --- Detect model type from first chunk and extract content ---
-            if model_type is None:
-                if "delta" in choice:
-                    model_type = "chat"
-                elif "text" in choice:
-                    model_type = "completion"
-
-            if model_type == "chat":
-                delta = choice.get("delta", {})
-                if "role" in delta and delta["role"]:
-                    role = delta["role"]
-                if "content" in delta and delta["content"]:
-                    full_content += delta["content"]
-            elif model_type == "completion":
-                if "text" in choice and choice["text"]:
-                    full_content += choice["text"]
-            # --- End content extraction ---
-
-            if choice.get("finish_reason"):
-                finish_reason = choice.get("finish_reason")
-
-        except (json.JSONDecodeError, IndexError) as e:
-            ctx.log.warn(f"SSE: Could not parse JSON chunk or invalid structure: {chunk_str[:100]} | Error: {e}")
-
-    # Ensure the final merged usage object is in the metadata
-    if final_usage:
-        metadata["usage"] = final_usage
-
-    # Assemble the final, consolidated response object based on detected type
-    if model_type == "chat":
-        final_response = {
-            **metadata,
-            "object": "chat.completion.aggregated",
-            "choices": [
-                {
-                    "index": 0,
-                    "message": {"role": role, "content": full_content},
-                    "finish_reason": finish_reason,
-                }
-            ],
-        }
-    elif model_type == "completion":
-        final_response = {
-            **metadata,
-            "object": "text_completion.aggregated",
-            "choices": [
-                {
-                    "index": 0,
-                    "text": full_content,
-                    "finish_reason": finish_reason,
-                }
-            ],
-        }
-    else: # Fallback for empty or unknown streams
-        final_response = {
-            **metadata,
-            "object": "unknown.aggregated",
-            "choices": [{"index": 0, "message": {"content": ""}, "finish_reason": finish_reason}],
-        }
-    
-    # Add usage if it was found
-    if "usage" in metadata:
-        final_response["usage"] = metadata["usage"]
+def _latency_bucket(latency: float) -> int:
+    """Maps a latency in seconds to its log2 histogram bucket (HIST_SCALE buckets per doubling)."""
+    bucket = int(math.log2(max(latency, 1e-6)) * HIST_SCALE + HIST_OFFSET)
+    return min(max(bucket, 0), HIST_BUCKETS - 1)
 
-    return final_response
+def _new_hist_entry() -> dict:
+    return {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * HIST_BUCKETS}
 
-def _estimate_tokens(text: str) -> int:
-    """A simple heuristic to estimate token count from text length."""
-    if not text:
-        return 0
-    # Based on the rule of thumb that 1 token is approx. 4 characters
-    return round(len(text) / 4)
+def _load_hist() -> defaultdict:
+    hist = defaultdict(_new_hist_entry)
+    try:
+        data = json.loads(HIST_PATH.read_text(encoding="utf-8"))
+        if data.get("buckets") == HIST_BUCKETS and data.get("scale") == HIST_SCALE and data.get("offset") == HIST_OFFSET:
+            hist.update(data["hosts"])
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass  # Missing or incompatible file: start from empty histograms
+    return hist
+
+def rotated_event_files(path: pathlib.Path = EVENTS_PATH) -> list[pathlib.Path]:
+    """Returns the copies `_rotate` has made of an events file (events.jsonl.1, .2, ...), oldest first."""
+    rotated = [p for p in path.parent.glob(f"{path.name}.*") if p.suffix[1:].isdigit()]
+    return sorted(rotated, key=lambda p: int(p.suffix[1:]), reverse=True)
 
 # -------- addon
 
 class CopilotLogger:
-    def __init__(self, on_event_callback: Optional[Callable[[dict], None]] = None):
+    def __init__(self, on_event_callback: Optional[Callable[[bytes], None]] = None):
+        # `on_event_callback` receives each event already encoded as JSON bytes
         self.on_event = on_event_callback
+        # events.jsonl is opened once, on the first event, and kept open until `done`
+        self._fp = None
+        self._fp_lock = threading.Lock()
+        self._hist = _load_hist()
+        self._hist_pending = 0
+        self._hist_lock = threading.Lock()
+        # Flushes pending histogram updates that haven't reached HIST_WRITE_EVERY yet
+        self._hist_timer: Optional[threading.Timer] = None
+
+    def _write_event(self, event_bytes: bytes):
+        with self._fp_lock:
+            if self._fp is None:
+                self._fp = open(EVENTS_PATH, "ab", buffering=EVENTS_BUFFER_SIZE)
+            self._fp.write(event_bytes)
+            self._fp.write(b"\n")
+            # Flush per event so the analyzer and /history see it right away
+            self._fp.flush()
+            if self._fp.tell() >= EVENTS_MAX_BYTES:
+                self._rotate()
+
+    def _rotate(self):
+        """Shifts events.jsonl to events.jsonl.1 (dropping the oldest copy) and starts a fresh file."""
+        self._fp.close()
+        self._fp = None
+        try:
+            for i in range(EVENTS_KEEP_ROTATED - 1, 0, -1):
+                src = EVENTS_PATH.with_name(f"{EVENTS_PATH.name}.{i}")
+                if src.exists():
+                    os.replace(src, EVENTS_PATH.with_name(f"{EVENTS_PATH.name}.{i + 1}"))
+            os.replace(EVENTS_PATH, EVENTS_PATH.with_name(f"{EVENTS_PATH.name}.1"))
+        finally:
+            # Reopen even if a rename failed; if this open fails too, `_write_event` retries it
+            self._fp = open(EVENTS_PATH, "ab", buffering=EVENTS_BUFFER_SIZE)
+
+    def _record_latency(self, host: str, latency: float):
+        with self._hist_lock:
+            entry = self._hist[host]
+            entry["count"] += 1
+            entry["sum"] += latency
+            entry["max"] = max(entry["max"], latency)
+            entry["buckets"][_latency_bucket(latency)] += 1
+            self._hist_pending += 1
+            if self._hist_pending >= HIST_WRITE_EVERY:
+                self._write_hist()
+            elif self._hist_timer is None:
+                self._hist_timer = threading.Timer(HIST_WRITE_DELAY_S, self._flush_hist)
+                self._hist_timer.daemon = True
+                self._hist_timer.start()
+
+    def _flush_hist(self):
+        with self._hist_lock:
+            self._hist_timer = None
+            if self._hist_pending:
+                self._write_hist()
+
+    def _write_hist(self):
+        """Atomically replaces hist.json with the current histograms. Caller holds `_hist_lock`."""
+        data = {"buckets": HIST_BUCKETS, "scale": HIST_SCALE, "offset": HIST_OFFSET, "hosts": self._hist}
+        tmp_path = HIST_PATH.with_name(HIST_PATH.name + ".tmp")
+        tmp_path.write_bytes(_dumps(data))
+        os.replace(tmp_path, HIST_PATH)
+        self._hist_pending = 0
+
+    def done(self):
+        with self._fp_lock:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+        with self._hist_lock:
+            if self._hist_timer is not None:
+                self._hist_timer.cancel()
+                self._hist_timer = None
+            if self._hist_pending:
+                self._write_hist()
 
     def request(self, flow: http.HTTPFlow):
-        if not _is_copilot_host(flow.request.host) or flow.request.method == "GET":
+        # Decide once per flow; the later hooks only check this flag
+        flow.metadata["copilot"] = flow.request.method != "GET" and flow.request.host in ALLOWED_HOSTS
+        if not flow.metadata["copilot"]:
             return
         # Mark request start (mitmproxy already tracks timestamp_start, we keep this as fallback)
         flow.metadata["t_req_start_meta"] = time.time()
 
     def responseheaders(self, flow: http.HTTPFlow):
         """Attach streaming callback for SSE so we capture every chunk without buffering."""
-        if not _is_copilot_host(flow.request.host) or flow.request.method == "GET":
-            return
-        if not flow.response:
+        if not flow.metadata.get("copilot") or not flow.response:
             return
 
-        resp_ct = flow.response.headers.get("content-type", "")
-        if _looks_like_sse(resp_ct):
+        # Classify the response once; `response` reuses these flags
+        resp_ct = flow.response.headers.get("content-type", "").lower()
+        flow.metadata["is_sse"] = "text/event-stream" in resp_ct
+        flow.metadata["is_json"] = "application/json" in resp_ct
+        if flow.metadata["is_sse"]:
             flow.metadata["sse_bytes"] = 0
-            flow.metadata["sse_chunks"] = [] # Store chunks for later processing
-            flow.metadata["sse_buffer"] = "" # Buffer for incomplete lines
+            flow.metadata["sse_chunks"] = [] # Store raw `data:` payloads for later processing
+            flow.metadata["sse_buffer"] = bytearray() # Buffer for incomplete lines
 
             def on_chunk(chunk: bytes):
+                buf = flow.metadata["sse_buffer"]
+                sse_chunks = flow.metadata["sse_chunks"]
                 # End-of-stream marker in mitmproxy is b""
                 if chunk == b"":
                     # Process any remaining data in the buffer
-                    if flow.metadata["sse_buffer"]:
-                        line = flow.metadata["sse_buffer"]
-                        if line.startswith("data: "):
-                            data_part = line[len("data: "):].strip()
-                            if data_part and data_part != "[DONE]":
-                                flow.metadata["sse_chunks"].append(data_part)
+                    if buf:
+                        _append_sse_data(bytes(buf), sse_chunks)
+                        buf.clear()
                     return chunk
 
-                flow.metadata["sse_bytes"] = flow.metadata.get("sse_bytes", 0) + len(chunk)
-                
-                # Add new data to buffer and split by newline
-                data = flow.metadata["sse_buffer"] + _decode(chunk)
-                lines = data.split("\n")
-                
-                # The last part might be incomplete, so it becomes the new buffer
-                flow.metadata["sse_buffer"] = lines.pop()
-
-                # Process all complete lines
-                for line in lines:
-                    line = line.strip()
-                    if line.startswith("data: "):
-                        data_part = line[len("data: "):].strip()
-                        if data_part and data_part != "[DONE]":
-                            flow.metadata["sse_chunks"].append(data_part)
-                
+                flow.metadata["sse_bytes"] += len(chunk)
+
+                # Append to the byte buffer and split off all complete lines at once;
+                # only the `data:` payloads are ever decoded, when parsed as JSON
+                buf.extend(chunk)
+                idx = buf.rfind(b"\n")
+                if idx >= 0:
+                    lines = bytes(buf[:idx]).split(b"\n")
+                    del buf[:idx + 1]
+                    for line in lines:
+                        if not line:  # Blank event separator
+                            continue
+                        _append_sse_data(line, sse_chunks)
+
                 return chunk  # pass-through unmodified
 
             flow.response.stream = on_chunk
 
     def response(self, flow: http.HTTPFlow):
-        if not _is_copilot_host(flow.request.host) or not flow.response or flow.request.method == "GET":
+        if not flow.metadata.get("copilot") or not flow.response:
             return
 
         # Compute timings
@@ -309,25 +264,26 @@ class CopilotLogger:
         streaming_duration_s = _safe_float((t_resp_end - t_resp_start) if (t_resp_end and t_resp_start) else None)
 
         # Sizes
-        req_bytes = len(flow.request.raw_content or b"")
+        req_bytes = _body_len(flow.request)
         # If we streamed SSE, raw_content may be empty—use counter
-        is_sse = "sse_chunks" in flow.metadata
+        is_sse = flow.metadata.get("is_sse", False)
         if is_sse:
             resp_bytes = flow.metadata.get("sse_bytes", 0)
         else:
-            resp_bytes = len(flow.response.raw_content or b"")
+            resp_bytes = _body_len(flow.response, _response_has_body(flow))
 
         req_ct = flow.request.headers.get("content-type", "")
         resp_ct = flow.response.headers.get("content-type", "")
 
-        # Handle request and response bodies
-        req_json_full = _safe_json(flow.request.raw_content) if ("application/json" in req_ct) else None
+        # Handle request and response bodies; each is parsed at most once per flow
+        is_json_req = "application/json" in req_ct
+        req_json_full = _safe_json(flow.request.raw_content) if is_json_req else None
         final_resp_json = None
 
         if is_sse:
             # Reconstruct the single aggregated JSON for SSE
-            final_resp_json = _reconstruct_sse_response(flow.metadata["sse_chunks"])
-        elif "application/json" in resp_ct:
+            final_resp_json = _reconstruct_sse_response(flow.metadata["sse_chunks"], ctx.log.warn)
+        elif flow.metadata.get("is_json"):
             final_resp_json = _safe_json(flow.response.raw_content)
 
         # Calculate output speed in Tokens Per Second (t/s)
@@ -368,15 +324,22 @@ class CopilotLogger:
                 elif "message" in choice and isinstance(choice.get("message"), dict):
                     text_content = choice["message"].get("content", "")
                 
-                if text_content:
+                # Content can also be a list of parts or null; the compiled helper only accepts str
+                if text_content and isinstance(text_content, str):
                     completion_tokens = _estimate_tokens(text_content)
 
         if completion_tokens is not None and streaming_duration_s is not None and streaming_duration_s > 1e-9:
             output_tps = completion_tokens / streaming_duration_s
 
         # Decide what to save based on config
-        req_json_to_save = req_json_full if SAVE_BODIES else _summarize_req_json(req_json_full)
-        resp_json_to_save = final_resp_json if SAVE_BODIES else _summarize_resp_json(final_resp_json)
+        req_json_to_save = req_json_full
+        resp_json_to_save = final_resp_json
+        if not SAVE_BODIES:
+            # Only non-empty JSON bodies have anything to summarize
+            if req_json_full:
+                req_json_to_save = _summarize_req_json(req_json_full, flow.request.raw_content)
+            if final_resp_json:
+                resp_json_to_save = _summarize_resp_json(final_resp_json, None if is_sse else flow.response.raw_content)
 
         # --- Organically create/update a `usage` object in the response JSON ---
         if resp_json_to_save is not None:
@@ -449,18 +412,30 @@ class CopilotLogger:
         }
 
         if SAVE_HEADERS:
-            rec["req_headers"] = dict(flow.request.headers)
-            rec["resp_headers"] = dict(flow.response.headers)
+            rec["req_headers"] = _header_pairs(flow.request.headers)
+            rec["resp_headers"] = _header_pairs(flow.response.headers)
 
-        # Write event to file
+        # Encode once; the same bytes go to the events file and to `on_event`
         try:
-            with open(EVENTS_PATH, "a", encoding="utf-8") as f:
-                f.write(json.dumps(rec) + "\n")
+            event_bytes = _dumps(rec)
         except Exception as e:
-            ctx.log.error(f"Failed to write to log file: {e}")
-
-        if self.on_event:
-            self.on_event(rec)
+            ctx.log.error(f"Failed to encode event: {e}")
+            event_bytes = None
+
+        if event_bytes is not None:
+            try:
+                self._write_event(event_bytes)
+            except Exception as e:
+                ctx.log.error(f"Failed to write to log file: {e}")
+
+        if latency_total is not None:
+            try:
+                self._record_latency(flow.request.host, latency_total)
+            except Exception as e:
+                ctx.log.error(f"Failed to update latency histogram: {e}")
+
+        if self.on_event and event_bytes is not None:
+            self.on_event(event_bytes)
 
         ctx.log.info(
             f"[Copilot] {flow.request.method} {flow.request.host}{flow.request.path} -> {flow.response.status_code} | "
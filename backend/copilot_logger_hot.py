@@ -0,0 +1,225 @@
+# copilot_logger_hot.py
+# Per-flow helpers of copilot_logger.py that run for every Copilot request or SSE chunk.
+# Fully annotated so the module can be compiled with mypyc (`mypyc copilot_logger_hot.py`);
+# Python imports the built extension in place of this file, and falls back to it when absent.
+import logging
+from typing import Any, Callable, Optional
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads  # type: ignore[assignment]
+
+_log = logging.getLogger(__name__)
+
+# JSON keys whose values the summarizers truncate, as they appear in a raw body
+_REQ_SUMMARY_KEYS = (b'"messages"', b'"prompt"', b'"suffix"', b'"prediction"', b'"extra"')
+_RESP_SUMMARY_KEY = b'"choices"'
+
+# Longest string the summarizers keep before cutting it and appending "..."
+_SUMMARY_MAX_CHARS = 100
+
+_DATA_PREFIX = b"data: "
+_DATA_PREFIX_LEN = len(_DATA_PREFIX)
+
+def _with_truncated(d: Any, key: str) -> Any:
+    """Returns `d` with its `key` string truncated, copying `d` only if that string is too long."""
+    if isinstance(d, dict):
+        value = d.get(key)
+        if isinstance(value, str) and len(value) > _SUMMARY_MAX_CHARS:
+            return {**d, key: value[:_SUMMARY_MAX_CHARS] + "..."}
+    return d
+
+def _summarize_req_json(data: Any, raw: Optional[bytes] = None) -> Any:
+    """Removes large message content from request JSON to save space."""
+    if not data or not isinstance(data, dict):
+        return data
+
+    # Fast path: the raw body has none of the fields we truncate
+    if raw is not None and not any(key in raw for key in _REQ_SUMMARY_KEYS):
+        return data
+
+    summary = data.copy()
+
+    # Handle chat-like requests with "messages"; short messages are passed through as-is
+    if isinstance(summary.get("messages"), list):
+        summary["messages"] = [_with_truncated(msg, "content") for msg in summary["messages"]]
+
+    # Handle completion-like requests with "prompt" and "suffix"
+    for key in ("prompt", "suffix"):
+        value = summary.get(key)
+        if isinstance(value, str) and len(value) > _SUMMARY_MAX_CHARS:
+            summary[key] = value[:_SUMMARY_MAX_CHARS] + "..."
+
+    # Handle "prediction" data which can contain large context
+    if isinstance(summary.get("prediction"), dict):
+        summary["prediction"] = _with_truncated(summary["prediction"], "content")
+
+    # Handle "extra" data which can contain large context
+    extra = summary.get("extra")
+    if isinstance(extra, dict) and isinstance(extra.get("context"), list):
+        context = extra["context"]
+        if any(isinstance(item, str) and len(item) > _SUMMARY_MAX_CHARS for item in context):
+            summary["extra"] = {
+                **extra,
+                "context": [
+                    item[:_SUMMARY_MAX_CHARS] + "..." if isinstance(item, str) and len(item) > _SUMMARY_MAX_CHARS else item
+                    for item in context
+                ],
+            }
+
+    return summary
+
+def _summarize_resp_json(data: Any, raw: Optional[bytes] = None) -> Any:
+    """Removes large message content from response JSON to save space."""
+    if not data or not isinstance(data, dict):
+        return data
+
+    # Fast path: the raw body has no "choices" to truncate
+    if raw is not None and _RESP_SUMMARY_KEY not in raw:
+        return data
+
+    summary = data.copy()
+    if isinstance(summary.get("choices"), list):
+        new_choices = []
+        for choice in summary["choices"]:
+            if isinstance(choice, dict):
+                # Handle chat-like responses
+                message = choice.get("message")
+                new_message = _with_truncated(message, "content")
+                if new_message is not message:
+                    choice = {**choice, "message": new_message}
+
+                # Handle completion-like responses
+                choice = _with_truncated(choice, "text")
+            new_choices.append(choice)
+        summary["choices"] = new_choices
+
+    return summary
+
+def _append_sse_data(line: bytes, chunks: list[bytes]) -> None:
+    """Appends the payload of an SSE `data:` line to `chunks`, skipping the [DONE] sentinel."""
+    if line.endswith(b"\r"):
+        line = line[:-1]
+    if line.startswith(_DATA_PREFIX):
+        # Surrounding whitespace is left in place; the JSON parser ignores it
+        data_part = line[_DATA_PREFIX_LEN:]
+        # Prefix match, so trailing whitespace after the sentinel doesn't turn it into a chunk
+        if data_part and not data_part.startswith(b"[DONE]"):
+            chunks.append(data_part)
+
+def _parse_sse_chunk(chunk: bytes, warn: Callable[[str], None]) -> Any:
+    """Parses one SSE data chunk, returning None (after a warning) if it is not valid JSON."""
+    try:
+        return _loads(chunk)
+    except ValueError as e:  # json and orjson decode errors are ValueErrors
+        warn(f"SSE: Could not parse JSON chunk or invalid structure: {chunk[:100].decode('utf-8', 'replace')} | Error: {e}")
+        return None
+
+def _reconstruct_sse_response(chunks: list[bytes], warn: Callable[[str], None] = _log.warning) -> dict:
+    """
+    Reconstructs a single JSON response from a list of SSE data chunks.
+    Handles both 'chat.completion' (delta.content) and 'completion' (text) formats.
+    Problems with individual chunks are reported through `warn`.
+    """
+    content_parts: list[str] = []
+    role: Any = None
+    finish_reason: Any = None
+    final_usage: dict[str, Any] = {}
+    metadata: dict[str, Any] = {}
+    model_type: Optional[str] = None # 'chat' or 'completion'
+    data: Any
+    choices: Any
+
+    chunks = [chunk for chunk in chunks if chunk.strip()]
+    # Parse the whole stream as one JSON array; only a malformed chunk sends us to per-chunk parsing
+    docs: list[Any]
+    try:
+        docs = _loads(b"[" + b",".join(chunks) + b"]")
+        if len(docs) != len(chunks):
+            raise ValueError("chunk count mismatch")
+    except ValueError:
+        docs = [_parse_sse_chunk(chunk, warn) for chunk in chunks]
+
+    for chunk, data in zip(chunks, docs):
+        if data is None:
+            continue
+        if not isinstance(data, dict):
+            warn(f"SSE: Parsed data is not a dictionary: {chunk[:100].decode('utf-8', 'replace')}")
+            continue
+
+        # Update metadata with any new non-null info from the current chunk
+        # This ensures we capture final metadata like 'id', 'model', 'usage'.
+        # `data` is ours to consume, so take "choices" out and merge the rest in one C-level update.
+        choices = data.pop("choices", None)
+        metadata.update(data)
+
+        # Merge usage stats, as they can appear in multiple chunks
+        if "usage" in data and isinstance(data["usage"], dict):
+            final_usage.update(data["usage"])
+
+        if not choices or not isinstance(choices, list) or not choices[0]:
+            continue # This chunk is likely metadata-only (e.g., final usage stats)
+
+        choice = choices[0]
+
+        # --- Detect model type from first chunk and extract content ---
+        if model_type is None:
+            if "delta" in choice:
+                model_type = "chat"
+            elif "text" in choice:
+                model_type = "completion"
+
+        if model_type == "chat":
+            delta = choice.get("delta", {})
+            if "role" in delta and delta["role"]:
+                role = delta["role"]
+            if "content" in delta and delta["content"]:
+                content_parts.append(delta["content"])
+        elif model_type == "completion":
+            if "text" in choice and choice["text"]:
+                content_parts.append(choice["text"])
+        # --- End content extraction ---
+
+        if choice.get("finish_reason"):
+            finish_reason = choice.get("finish_reason")
+
+    # Join the streamed pieces once instead of growing a string per chunk
+    full_content = "".join(content_parts)
+
+    # Ensure the final merged usage object is in the metadata
+    if final_usage:
+        metadata["usage"] = final_usage
+
+    # Assemble the final, consolidated response object in place, based on detected type
+    final_response = metadata
+    if model_type == "chat":
+        final_response["object"] = "chat.completion.aggregated"
+        final_response["choices"] = [
+            {
+                "index": 0,
+                "message": {"role": role, "content": full_content},
+                "finish_reason": finish_reason,
+            }
+        ]
+    elif model_type == "completion":
+        final_response["object"] = "text_completion.aggregated"
+        final_response["choices"] = [
+            {
+                "index": 0,
+                "text": full_content,
+                "finish_reason": finish_reason,
+            }
+        ]
+    else: # Fallback for empty or unknown streams
+        final_response["object"] = "unknown.aggregated"
+        final_response["choices"] = [{"index": 0, "message": {"content": ""}, "finish_reason": finish_reason}]
+
+    return final_response
+
+def _estimate_tokens(text: str) -> int:
+    """A simple heuristic to estimate token count from text length."""
+    if not text:
+        return 0
+    # Based on the rule of thumb that 1 token is approx. 4 characters
+    return len(text) >> 2
@@ -4,16 +4,25 @@ import logging
 import pathlib
 import os
 import queue
-from multiprocessing import Process, Queue
+import threading
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
 
 import uvicorn
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from mitmproxy.tools.dump import DumpMaster
 from mitmproxy.options import Options
 
-from copilot_logger import CopilotLogger
+from copilot_logger import CopilotLogger, rotated_event_files
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,10 +31,19 @@ logger = logging.getLogger(__name__)
 BASE_DIR = pathlib.Path(os.path.expanduser("~/.mitmproxy/intercepter_vscode/copilot_mitm"))
 EVENTS_PATH = BASE_DIR / "events.jsonl"
 BASE_DIR.mkdir(parents=True, exist_ok=True)
+# How long the WebSocket handler waits for more events once it sees a burst
+COALESCE_WINDOW_S = 0.005
+# Events the mitmproxy process buffers while the API process isn't reading; newer ones are dropped
+EVENT_OUTBOX_SIZE = 10_000
 
 app = FastAPI()
-event_queue = Queue()
+# One-way pipe carrying JSON-encoded events from the mitmproxy process
+event_reader, event_writer = Pipe(duplex=False)
 mitm_process: Process | None = None
+# One asyncio.Queue per connected WebSocket client, fed by `publish_event`
+subscribers: set[asyncio.Queue] = set()
+# Thread-based relay, used when the event loop can't watch the pipe (Windows' ProactorEventLoop)
+relay_task: asyncio.Task | None = None
 
 # Add CORS middleware to allow requests from your frontend
 app.add_middleware(
@@ -36,13 +54,27 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-def run_mitmproxy(queue_instance: Queue):
+def run_mitmproxy(conn: Connection):
     """Runs mitmproxy's DumpMaster in a separate process."""
     
-    def on_event_callback(event_data):
-        """Callback to put event data (as a dictionary) into the shared queue without blocking."""
+    # Pipe writes block once the API process falls behind, so they happen on a sender
+    # thread; the proxy's event loop only ever does a non-blocking put.
+    outbox: queue.Queue = queue.Queue(maxsize=EVENT_OUTBOX_SIZE)
+
+    def send_events():
+        while True:
+            event_bytes = outbox.get()
+            try:
+                conn.send_bytes(event_bytes)
+            except OSError:
+                logger.warning("Event pipe is closed. An event from mitmproxy was dropped.")
+
+    threading.Thread(target=send_events, name="event-sender", daemon=True).start()
+
+    def on_event_callback(event_bytes: bytes):
+        """Callback to hand the logger's JSON-encoded event to the sender thread without blocking."""
         try:
-            queue_instance.put_nowait(event_data)
+            outbox.put_nowait(event_bytes)
         except queue.Full:
             logger.warning("Event queue is full. An event from mitmproxy was dropped.")
 
@@ -50,7 +82,8 @@ def run_mitmproxy(queue_instance: Queue):
         opts = Options()
         opts.listen_host = '0.0.0.0'
         opts.listen_port = 8080
-        opts.allow_hosts = [".*githubcopilot\\.com"]
+        # Anchored, so non-matching hosts are rejected without backtracking through `.*`
+        opts.allow_hosts = [r"^(?:[a-z0-9-]+\.)*githubcopilot\.com(?::\d+)?$"]
         
         master = DumpMaster(opts)
         # Pass the callback to the logger addon
@@ -58,67 +91,144 @@ def run_mitmproxy(queue_instance: Queue):
         logger.info("mitmproxy is starting on port 8080")
         await master.run()
 
+    # A forked child can inherit uvloop's policy from uvicorn; keep mitmproxy on the stock loop
+    asyncio.set_event_loop_policy(None)
     asyncio.run(start_proxy())
 
+def publish_event(event_bytes: bytes):
+    """Fans an encoded event out to every connected client."""
+    for client_queue in subscribers:
+        client_queue.put_nowait(event_bytes)
+
+def on_event_readable():
+    """Called by the event loop when the pipe is readable."""
+    try:
+        event_bytes = event_reader.recv_bytes()
+    except EOFError:
+        # The mitmproxy process is gone
+        asyncio.get_running_loop().remove_reader(event_reader.fileno())
+        return
+    publish_event(event_bytes)
+
+async def relay_events():
+    """Fallback for loops without add_reader: waits on the pipe in a worker thread."""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            event_bytes = await loop.run_in_executor(None, event_reader.recv_bytes)
+        except (EOFError, OSError):
+            # The mitmproxy process is gone
+            return
+        publish_event(event_bytes)
+
 @app.on_event("startup")
 async def startup_event():
-    """Start the mitmproxy process on server startup."""
-    global mitm_process
-    mitm_process = Process(target=run_mitmproxy, args=(event_queue,))
+    """Start the mitmproxy process and watch its event pipe on server startup."""
+    global mitm_process, relay_task
+    mitm_process = Process(target=run_mitmproxy, args=(event_writer,))
     mitm_process.start()
+    # Only the child writes; closing our copy lets the reader see EOF if it exits
+    event_writer.close()
     logger.info("mitmproxy process started.")
+    try:
+        asyncio.get_running_loop().add_reader(event_reader.fileno(), on_event_readable)
+    except NotImplementedError:
+        relay_task = asyncio.create_task(relay_events())
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Stop the mitmproxy process on server shutdown."""
     global mitm_process
+    if relay_task is None:
+        asyncio.get_running_loop().remove_reader(event_reader.fileno())
     if mitm_process and mitm_process.is_alive():
         logger.info("Terminating mitmproxy process.")
         mitm_process.terminate()
         mitm_process.join()
         logger.info("mitmproxy process terminated.")
+    if relay_task:
+        # The child's exit closes the pipe, which ends the relay
+        await relay_task
 
-@app.get("/history", response_model=list[dict])
+def _is_event_line(line: bytes) -> bool:
+    try:
+        return isinstance(_loads(line), dict)
+    except ValueError:
+        return False
+
+def _read_history() -> bytes:
+    """
+    Builds the /history response body (a JSON array of events) from the rotated event files
+    and events.jsonl; runs in a worker thread. Lines are validated but never re-serialized.
+    """
+    lines = []
+    # Oldest rotated copy first, so events stay in the order they were logged
+    for path in [*rotated_event_files(EVENTS_PATH), EVENTS_PATH]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            continue  # Rotated away between listing and opening
+        # Leave an unterminated last line alone; the logger may still be writing it
+        data = data[:data.rfind(b"\n") + 1]
+        lines.extend(line for line in data.split(b"\n") if line.strip())
+    # One parse over every line as a JSON array; only a bad line sends us to the slow path
+    body = b"[" + b",".join(lines) + b"]"
+    try:
+        events = _loads(body)
+        if len(events) == len(lines) and all(isinstance(e, dict) for e in events):
+            return body
+    except ValueError:
+        pass
+    valid = []
+    for line in lines:
+        if _is_event_line(line):
+            valid.append(line)
+        else:
+            logger.warning(f"Skipping malformed line in event history: {line.strip()!r}")
+    return b"[" + b",".join(valid) + b"]"
+
+@app.get("/history")
 async def get_history():
-    """Reads and returns all historical events from the events.jsonl file."""
-    if not EVENTS_PATH.exists():
-        return []
-    
-    events = []
+    """Reads and returns all historical events, including the rotated event files."""
     try:
-        with open(EVENTS_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip():
-                    try:
-                        events.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        logger.warning(f"Skipping malformed line in events.jsonl: {line.strip()}")
-        return events
+        # Read and validate off the event loop; the lines already are the JSON response body,
+        # so nothing is decoded or re-encoded on the loop
+        body = await asyncio.to_thread(_read_history)
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         logger.error(f"Error reading history file: {e}")
         return JSONResponse(content={"error": "Could not read history file"}, status_code=500)
 
-
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """Handles WebSocket connections and pushes data from the queue."""
+    """Handles WebSocket connections and pushes events as soon as they are relayed."""
     await websocket.accept()
     logger.info("Frontend connected via WebSocket.")
+    client_queue: asyncio.Queue = asyncio.Queue()
+    subscribers.add(client_queue)
     try:
         while True:
-            if not event_queue.empty():
-                # Get the event dictionary from the queue
-                event_dict = event_queue.get()
-                
-                # The logger now handles file writing. We just send to the client.
-                event_json_str = json.dumps(event_dict, ensure_ascii=False)
-                await websocket.send_text(event_json_str)
-
-            await asyncio.sleep(0.1) # Prevent busy-waiting
+            drained = [await client_queue.get()]
+            if not client_queue.empty():
+                # A burst is in progress; give it a few ms to fill up before draining
+                await asyncio.sleep(COALESCE_WINDOW_S)
+            while True:
+                try:
+                    drained.append(client_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            # The logger now handles file writing, and events arrive already encoded.
+            # Everything drained goes out as one JSON array in a single frame.
+            await websocket.send_text((b"[" + b",".join(drained) + b"]").decode("utf-8"))
     except WebSocketDisconnect:
         logger.info("Frontend disconnected.")
     except Exception as e:
         logger.error(f"WebSocket Error: {e}")
+    finally:
+        subscribers.discard(client_queue)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, lifespan="on", loop="asyncio")
\ No newline at end of file
+    # "auto" picks uvloop and httptools when installed, and falls back to asyncio/h11 otherwise
+    uvicorn.run(app, host="0.0.0.0", port=8000, lifespan="on", loop="auto", http="auto")
\ No newline at end of file
@@ -3,12 +3,12 @@ import os, json, time, pathlib
 from typing import Optional
 from mitmproxy import http, ctx
 
-ALLOWED_HOSTS = {
+ALLOWED_HOSTS = frozenset({
     "api.githubcopilot.com",
     "api.individual.githubcopilot.com",
     "proxy.githubcopilot.com",
     "proxy.individual.githubcopilot.com",
-}
+})
 
 BASE_DIR = pathlib.Path(os.path.expanduser("~/.mitmproxy/intercepter_vscode/copilot_mitm"))
 LOG_DIR = BASE_DIR / "bodies"
@@ -18,9 +18,6 @@ LOG_DIR.mkdir(parents=True, exist_ok=True)
 
 # -------- helpers
 
-def _is_copilot_host(host: str) -> bool:
-    return host in ALLOWED_HOSTS
-
 def _is_textual(ct: str) -> bool:
     ct = (ct or "").lower()
     return (
@@ -54,6 +51,11 @@ def _new_paths(flow: http.HTTPFlow):
         LOG_DIR / f"{base}_resp.txt",
     )
 
+def _close_resp_fh(flow: http.HTTPFlow):
+    fh = flow.metadata.pop("resp_fh", None)
+    if fh is not None:
+        fh.close()
+
 def _safe_float(x: Optional[float]) -> Optional[float]:
     try:
         return float(x) if x is not None else None
@@ -73,7 +75,9 @@ def _safe_json(b: Optional[bytes]) -> Optional[dict]:
 
 class CopilotLogger:
     def request(self, flow: http.HTTPFlow):
-        if not _is_copilot_host(flow.request.host):
+        # Decide once per flow; the later hooks only check this flag
+        flow.metadata["copilot"] = flow.request.host in ALLOWED_HOSTS
+        if not flow.metadata["copilot"]:
             return
 
         # Allocate per-flow file paths once
@@ -82,7 +86,7 @@ class CopilotLogger:
         flow.metadata["resp_path"] = str(resp_path)
 
         # Persist textual request body
-        req_ct = flow.request.headers.get("content-type", "")
+        req_ct = flow.metadata["req_ct"] = flow.request.headers.get("content-type", "")
         if _is_textual(req_ct):
             _write(req_path, _decode(flow.request.raw_content))
 
@@ -91,9 +95,7 @@ class CopilotLogger:
 
     def responseheaders(self, flow: http.HTTPFlow):
         """Attach streaming callback for SSE so we capture every chunk without buffering."""
-        if not _is_copilot_host(flow.request.host):
-            return
-        if not flow.response:
+        if not flow.metadata.get("copilot") or not flow.response:
             return
 
         resp_ct = flow.response.headers.get("content-type", "")
@@ -101,20 +103,27 @@ class CopilotLogger:
             resp_path = pathlib.Path(flow.metadata.get("resp_path") or _new_paths(flow)[1])
             flow.metadata["resp_path"] = str(resp_path)
             flow.metadata["sse_bytes"] = 0
+            # Open the body file once per flow; chunks are written as raw bytes
+            resp_path.parent.mkdir(parents=True, exist_ok=True)
+            resp_fh = flow.metadata["resp_fh"] = open(resp_path, "ab", buffering=1 << 15)
 
             def on_chunk(chunk: bytes):
                 # End-of-stream marker in mitmproxy is b""
                 if chunk == b"":
+                    resp_fh.close()
                     return chunk
-                txt = _decode(chunk)
-                _write(resp_path, txt)
-                flow.metadata["sse_bytes"] = flow.metadata.get("sse_bytes", 0) + len(chunk)
+                resp_fh.write(chunk)
+                flow.metadata["sse_bytes"] += len(chunk)
                 return chunk  # pass-through unmodified
 
             flow.response.stream = on_chunk
 
+    def error(self, flow: http.HTTPFlow):
+        # Flows that fail never reach `response`; don't leave their SSE body file open
+        _close_resp_fh(flow)
+
     def response(self, flow: http.HTTPFlow):
-        if not _is_copilot_host(flow.request.host) or not flow.response:
+        if not flow.metadata.get("copilot") or not flow.response:
             return
 
         # Compute timings
@@ -133,8 +142,11 @@ class CopilotLogger:
         else:
             resp_bytes = len(flow.response.raw_content or b"")
 
-        req_ct = flow.request.headers.get("content-type", "")
+        # The request content type was already read in `request`
+        req_ct = flow.metadata.get("req_ct") or flow.request.headers.get("content-type", "")
         resp_ct = flow.response.headers.get("content-type", "")
+        is_json_req = "application/json" in req_ct
+        is_json_resp = "application/json" in resp_ct
 
         # If not SSE and textual, persist full response body now
         # The check for `sse_bytes` ensures we don't overwrite a streamed response.
@@ -144,6 +156,9 @@ class CopilotLogger:
             if flow.response.raw_content:
                 _write(resp_path, _decode(flow.response.raw_content), mode="w")
 
+        # Release the streamed SSE body file, in case the stream was cut short
+        _close_resp_fh(flow)
+
         # Write the summary event
         rec = {
             "ts_end": t_resp_end,
@@ -159,8 +174,8 @@ class CopilotLogger:
             "resp_ct": resp_ct,
             "req_path": flow.metadata.get("req_path"),
             "resp_path": flow.metadata.get("resp_path"),
-            "req_json": _safe_json(flow.request.raw_content) if ("application/json" in req_ct) else None,
-            "resp_json": _safe_json(flow.response.raw_content) if ("application/json" in resp_ct) else None,
+            "req_json": _safe_json(flow.request.raw_content) if is_json_req else None,
+            "resp_json": _safe_json(flow.response.raw_content) if is_json_resp else None,
         }
 
         with open(EVENTS_PATH, "a", encoding="utf-8") as f:
@@ -0,0 +1,5 @@
+import pathlib
+import sys
+
+# The backend modules are plain scripts, not a package; make them importable from the tests
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
@@ -0,0 +1,45 @@
+from copilot_logger_hot import _append_sse_data, _reconstruct_sse_response
+
+
+def _collect(*lines: bytes) -> list[bytes]:
+    chunks: list[bytes] = []
+    for line in lines:
+        _append_sse_data(line, chunks)
+    return chunks
+
+
+def test_data_lines_are_collected_without_prefix():
+    assert _collect(b'data: {"a":1}', b'data: {"b":2}\r') == [b'{"a":1}', b'{"b":2}']
+
+
+def test_non_data_lines_are_ignored():
+    assert _collect(b"event: ping", b": keep-alive", b"data: ") == []
+
+
+def test_done_sentinel_is_skipped_with_trailing_whitespace():
+    assert _collect(b"data: [DONE]", b"data: [DONE] ", b"data: [DONE]\t\r") == []
+
+
+def test_reconstruct_joins_chat_deltas():
+    chunks = _collect(
+        b'data: {"id":"x","choices":[{"delta":{"role":"assistant","content":"Hel"}}]}',
+        b'data: {"choices":[{"delta":{"content":"lo"},"finish_reason":"stop"}]}',
+        b'data: {"usage":{"completion_tokens":2}}',
+        b"data: [DONE] ",
+    )
+    warnings: list[str] = []
+    response = _reconstruct_sse_response(chunks, warnings.append)
+
+    assert warnings == []
+    assert response["id"] == "x"
+    assert response["usage"] == {"completion_tokens": 2}
+    assert response["choices"][0]["message"] == {"role": "assistant", "content": "Hello"}
+    assert response["choices"][0]["finish_reason"] == "stop"
+
+
+def test_reconstruct_skips_malformed_chunks():
+    warnings: list[str] = []
+    response = _reconstruct_sse_response([b'{"choices":[{"text":"a"}]}', b"{bad", b'{"choices":[{"text":"b"}]}'], warnings.append)
+
+    assert response["choices"][0]["text"] == "ab"
+    assert len(warnings) == 1
@@ -0,0 +1,84 @@
+import json
+
+from copilot_logger_hot import _SUMMARY_MAX_CHARS, _summarize_req_json, _summarize_resp_json
+
+LONG = "x" * (_SUMMARY_MAX_CHARS + 1)
+SHORT = "y" * _SUMMARY_MAX_CHARS
+
+
+def _raw(data: dict) -> bytes:
+    return json.dumps(data).encode()
+
+
+def test_req_truncates_long_strings():
+    data = {
+        "messages": [{"role": "user", "content": LONG}],
+        "prompt": LONG,
+        "suffix": LONG,
+        "prediction": {"content": LONG},
+        "extra": {"context": [LONG, SHORT]},
+    }
+    summary = _summarize_req_json(data, _raw(data))
+
+    truncated = LONG[:_SUMMARY_MAX_CHARS] + "..."
+    assert summary["messages"][0] == {"role": "user", "content": truncated}
+    assert summary["prompt"] == truncated
+    assert summary["suffix"] == truncated
+    assert summary["prediction"]["content"] == truncated
+    assert summary["extra"]["context"] == [truncated, SHORT]
+    # The parsed request itself is left untouched
+    assert data["prompt"] == LONG
+    assert data["messages"][0]["content"] == LONG
+
+
+def test_req_keeps_strings_at_the_limit():
+    message = {"role": "user", "content": SHORT}
+    data = {"messages": [message], "prompt": SHORT}
+    summary = _summarize_req_json(data, _raw(data))
+
+    assert summary["prompt"] == SHORT
+    # Short messages are passed through without being copied
+    assert summary["messages"][0] is message
+
+
+def test_req_fast_path_returns_original_dict():
+    data = {"model": "gpt-4o", "temperature": 0}
+    assert _summarize_req_json(data, _raw(data)) is data
+
+
+def test_req_without_raw_still_summarizes():
+    data = {"prompt": LONG}
+    assert _summarize_req_json(data)["prompt"] == LONG[:_SUMMARY_MAX_CHARS] + "..."
+
+
+def test_resp_truncates_long_choices():
+    data = {
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": LONG}},
+            {"index": 1, "text": LONG},
+        ]
+    }
+    summary = _summarize_resp_json(data, _raw(data))
+
+    truncated = LONG[:_SUMMARY_MAX_CHARS] + "..."
+    assert summary["choices"][0]["message"] == {"role": "assistant", "content": truncated}
+    assert summary["choices"][1]["text"] == truncated
+    assert data["choices"][0]["message"]["content"] == LONG
+
+
+def test_resp_keeps_short_choices_without_copying():
+    choice = {"index": 0, "message": {"role": "assistant", "content": SHORT}}
+    data = {"choices": [choice]}
+    summary = _summarize_resp_json(data, _raw(data))
+
+    assert summary["choices"][0] is choice
+
+
+def test_resp_fast_path_returns_original_dict():
+    data = {"id": "x", "usage": {"total_tokens": 3}}
+    assert _summarize_resp_json(data, _raw(data)) is data
+
+
+def test_non_dict_input_is_returned_as_is():
+    assert _summarize_req_json(None) is None
+    assert _summarize_resp_json([1, 2]) == [1, 2]
@@ -484,23 +484,25 @@ const HomePage: React.FC = () => {
         };
 
         ws.onmessage = (event) => {
-            const newEvent: CopilotEvent = JSON.parse(event.data);
+            // The backend coalesces bursts into one array per frame
+            const parsed: CopilotEvent | CopilotEvent[] = JSON.parse(event.data);
+            const newEvents = Array.isArray(parsed) ? parsed : [parsed];
 
             // Incremental update
-            setAllEvents(prevEvents => [...prevEvents, newEvent]);
-            setStats(prevStats => updateStatsIncrementally(prevStats, newEvent));
-            setHeatmapData(prevData => {
+            setAllEvents(prevEvents => [...prevEvents, ...newEvents]);
+            setStats(prevStats => newEvents.reduce(updateStatsIncrementally, prevStats));
+            setHeatmapData(prevData => newEvents.reduce((data, newEvent) => {
                 const date = new Date(newEvent.ts_end * 1000).toISOString().split('T')[0];
                 const usage = newEvent.resp_json?.usage;
                 const totalTokens = usage?.total_tokens ?? (usage?.prompt_tokens ?? 0) + (usage?.completion_tokens ?? 0);
                 
-                const existingDate = prevData.find(d => d.date === date);
+                const existingDate = data.find(d => d.date === date);
                 if (existingDate) {
-                    return prevData.map(d => d.date === date ? { ...d, count: d.count + totalTokens } : d);
+                    return data.map(d => d.date === date ? { ...d, count: d.count + totalTokens } : d);
                 } else {
-                    return [...prevData, { date, count: totalTokens }];
+                    return [...data, { date, count: totalTokens }];
                 }
-            });
+            }, prevData));
         };
 
         ws.onerror = (err) => {